@@ -1,27 +1,252 @@
 from __future__ import annotations
+import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import os
 import re
-from typing import Any, List
+import signal
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby, islice
+from operator import itemgetter
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, List
+import httpx
 import mysql.connector
-import requests
-import urllib3
+from mysql.connector import pooling
 import yaml
 
+try:
+    from yaml import CSafeLoader as YamlSafeLoader  # Cargador en C (libyaml)
+except ImportError:
+    from yaml import SafeLoader as YamlSafeLoader
+
+try:
+    from orjson import dumps as _json_dumps, loads as _json_loads
+except ImportError:  # orjson es opcional; se usa la librería estándar
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode()
+    _json_loads = json.loads
+
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # Sin estas dependencias solo se usa la caché exacta
+    SentenceTransformer = None
+
 # ---------------------------------------------------------------------------
 # Configuración del LLM remoto
 # ---------------------------------------------------------------------------
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)  # Desactiva las advertencias de seguridad de urllib3
 URL_BASE_LM = "http://192.168.1.60:1234/v1"  # URL base del modelo remoto
 NOMBRE_MODELO = "gemma-3-12b-it-qat"  # Nombre del modelo remoto
 ENCABEZADOS = {"Content-Type": "application/json"}  # Encabezados para las solicitudes HTTP
+RUTA_CACHE_LLM = os.path.join(".llm_cache", "respuestas.sqlite3")  # Caché en disco de respuestas del modelo
+MODELO_EMBEDDINGS = "sentence-transformers/all-MiniLM-L6-v2"  # Modelo local para la caché semántica
+UMBRAL_SIMILITUD = 0.95  # Similitud coseno mínima para reutilizar una respuesta
+VENTANA_CONCURRENCIA = 32  # Solicitudes asíncronas en curso como máximo
+REINTENTOS_LLM = 3  # Reintentos ante respuestas de sobrecarga del servidor
+FACTOR_ESPERA = 0.5  # Espera base (s) del retroceso exponencial entre reintentos
+ESTADOS_REINTENTO = (429, 502, 503, 504)  # Códigos HTTP que se reintentan
+LIMITES_HTTP = httpx.Limits(max_connections=64, max_keepalive_connections=32)  # Conexiones abiertas al servidor
+
+
+def _respuesta_error(mensaje: str) -> dict[str, Any]:
+    """Devuelve un mensaje de error con la misma forma que una respuesta del modelo."""
+    return {"choices": [{"message": {"content": mensaje}}], "error": True}
+
+
+# ---------------------------------------------------------------------------
+# Caché de respuestas del LLM
+# ---------------------------------------------------------------------------
+
+class CacheRespuestas:
+    """
+    Caché en disco (SQLite) de respuestas del modelo en dos niveles:
+    coincidencia exacta por hash y, para las entradas guardadas con
+    semantica=True y si sentence-transformers está disponible, similitud
+    semántica del último mensaje del usuario.
+    """
+    def __init__(self, ruta: str, umbral: float = UMBRAL_SIMILITUD):
+        self.ruta = ruta
+        self.umbral = umbral
+        self._codificador = None  # Se carga al primer uso
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        with sqlite3.connect(self.ruta) as bd:
+            bd.execute(
+                "CREATE TABLE IF NOT EXISTS respuestas ("
+                "clave TEXT PRIMARY KEY, contexto TEXT, texto TEXT, embedding BLOB, respuesta TEXT)"
+            )
+            bd.execute("CREATE INDEX IF NOT EXISTS idx_contexto ON respuestas (contexto)")
+
+    def _codificar(self, texto: str):
+        """Devuelve el embedding normalizado del texto, o None si no hay caché semántica."""
+        if SentenceTransformer is None:
+            return None
+        if self._codificador is None:
+            try:
+                self._codificador = SentenceTransformer(MODELO_EMBEDDINGS)
+            except Exception:
+                self._codificador = False  # No se vuelve a intentar durante la sesión
+        if self._codificador is False:
+            return None
+        return self._codificador.encode(texto, normalize_embeddings=True).astype(np.float32)
+
+    def obtener(self, clave: str, contexto: str, texto: str, semantica: bool = False) -> dict[str, Any] | None:
+        """
+        Busca una respuesta en la caché.
+
+        Parámetros:
+        - clave: Hash de la solicitud completa.
+        - contexto: Hash de todo salvo el último mensaje; acota la búsqueda semántica.
+        - texto: Último mensaje del usuario.
+        - semantica: Si es False solo se aceptan coincidencias exactas.
+
+        Retorna:
+        - Respuesta JSON almacenada o None si no hay coincidencia.
+        """
+        with sqlite3.connect(self.ruta) as bd:
+            fila = bd.execute("SELECT respuesta FROM respuestas WHERE clave = ?", (clave,)).fetchone()
+            if fila is not None:
+                return json.loads(fila[0])
+            embedding = self._codificar(texto) if semantica else None
+            if embedding is None:
+                return None
+            # Los números suelen cambiar el significado (años, cantidades) sin apenas mover el embedding
+            numeros = re.findall(r"\d+", texto)
+            mejor, mejor_similitud = None, self.umbral
+            for texto_guardado, blob, respuesta in bd.execute(
+                "SELECT texto, embedding, respuesta FROM respuestas WHERE contexto = ? AND embedding IS NOT NULL",
+                (contexto,),
+            ):
+                similitud = float(np.dot(embedding, np.frombuffer(blob, dtype=np.float32)))
+                if similitud >= mejor_similitud and re.findall(r"\d+", texto_guardado) == numeros:
+                    mejor, mejor_similitud = respuesta, similitud
+        return json.loads(mejor) if mejor is not None else None
+
+    def guardar(
+        self, clave: str, contexto: str, texto: str, respuesta: dict[str, Any], semantica: bool = False
+    ) -> None:
+        """Guarda una respuesta en la caché; solo con semantica=True podrá recuperarse por similitud."""
+        embedding = self._codificar(texto) if semantica else None
+        with sqlite3.connect(self.ruta) as bd:
+            bd.execute(
+                "INSERT OR REPLACE INTO respuestas VALUES (?, ?, ?, ?, ?)",
+                (clave, contexto, texto, embedding.tobytes() if embedding is not None else None, json.dumps(respuesta)),
+            )
+
+    def vaciar(self) -> None:
+        """Elimina todas las respuestas guardadas, por ejemplo si se guardó una consulta SQL errónea."""
+        with sqlite3.connect(self.ruta) as bd:
+            bd.execute("DELETE FROM respuestas")
+
+
+def cachear_respuesta(funcion: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Decora generar_respuesta o generar_respuesta_async para consultar y poblar su caché.
+
+    La función decorada acepta además semantica=True para permitir reutilizar
+    respuestas a preguntas parecidas. Solo debe usarse cuando el último mensaje
+    es una única pregunta (generación de SQL): si incluye datos u otras
+    preguntas, dos mensajes casi iguales pueden necesitar respuestas distintas.
+    """
+    def claves(self: ModeloRemoto, mensajes, temperatura, top_p, max_tokens) -> tuple[str, str, str]:
+        parametros = (self.nombre_modelo, temperatura, top_p, max_tokens)
+        clave = hashlib.sha256(json.dumps((parametros, mensajes), sort_keys=True).encode()).hexdigest()
+        contexto = hashlib.sha256(json.dumps((parametros, mensajes[:-1]), sort_keys=True).encode()).hexdigest()
+        return clave, contexto, mensajes[-1]["content"]
+
+    if asyncio.iscoroutinefunction(funcion):
+        @functools.wraps(funcion)
+        async def envoltura_async(
+            self: ModeloRemoto,
+            *,
+            mensajes: list[dict[str, str]],
+            temperatura: float = 0.7,
+            top_p: float = 0.9,
+            max_tokens: int,
+            semantica: bool = False,
+            **opciones: Any,
+        ) -> dict[str, Any]:
+            if self.cache is None:
+                return await funcion(
+                    self, mensajes=mensajes, temperatura=temperatura, top_p=top_p, max_tokens=max_tokens, **opciones
+                )
+            clave, contexto, texto = claves(self, mensajes, temperatura, top_p, max_tokens)
+            respuesta = self.cache.obtener(clave, contexto, texto, semantica)
+            if respuesta is None:
+                respuesta = await funcion(
+                    self, mensajes=mensajes, temperatura=temperatura, top_p=top_p, max_tokens=max_tokens, **opciones
+                )
+                if not respuesta.get("error"):
+                    self.cache.guardar(clave, contexto, texto, respuesta, semantica)
+            return respuesta
+        return envoltura_async
 
+    @functools.wraps(funcion)
+    def envoltura(
+        self: ModeloRemoto,
+        *,
+        mensajes: list[dict[str, str]],
+        temperatura: float = 0.7,
+        top_p: float = 0.9,
+        max_tokens: int,
+        semantica: bool = False,
+        **opciones: Any,
+    ) -> dict[str, Any]:
+        if self.cache is None:
+            return funcion(
+                self, mensajes=mensajes, temperatura=temperatura, top_p=top_p, max_tokens=max_tokens, **opciones
+            )
+        clave, contexto, texto = claves(self, mensajes, temperatura, top_p, max_tokens)
+        respuesta = self.cache.obtener(clave, contexto, texto, semantica)
+        if respuesta is None:
+            respuesta = funcion(
+                self, mensajes=mensajes, temperatura=temperatura, top_p=top_p, max_tokens=max_tokens, **opciones
+            )
+            if not respuesta.get("error"):
+                self.cache.guardar(clave, contexto, texto, respuesta, semantica)
+        elif opciones.get("al_recibir") is not None:
+            opciones["al_recibir"](respuesta["choices"][0]["message"]["content"])  # Entrega de golpe lo guardado
+        return respuesta
+    return envoltura
+
+
+# ---------------------------------------------------------------------------
+# Modelo remoto
+# ---------------------------------------------------------------------------
 
 class ModeloRemoto:
     """Envoltura mínima para un modelo remoto."""
-    def __init__(self, url_base: str, nombre_modelo: str):
+    def __init__(self, url_base: str, nombre_modelo: str, ruta_cache: str | None = RUTA_CACHE_LLM):
         self.url_base = url_base.rstrip("/")  # Asegura que la URL base no termine con "/"
         self.nombre_modelo = nombre_modelo  # Asigna el nombre del modelo
+        self.cache = CacheRespuestas(ruta_cache) if ruta_cache else None  # None desactiva la caché
+        self.cliente = httpx.Client(  # Reutiliza las conexiones entre solicitudes (keep-alive / HTTP/2)
+            headers=ENCABEZADOS,
+            timeout=120,  # Tiempo máximo de espera para la solicitud
+            transport=httpx.HTTPTransport(http2=True, verify=False, limits=LIMITES_HTTP, retries=REINTENTOS_LLM),
+        )
+
+    def _construir_carga(
+        self,
+        mensajes: list[dict[str, str]],
+        temperatura: float,
+        top_p: float,
+        max_tokens: int,
+    ) -> dict[str, Any]:
+        """Construye el cuerpo de la solicitud de chat."""
+        return {
+            "model": self.nombre_modelo,  # Especifica el modelo a usar
+            "messages": mensajes,  # Mensajes enviados al modelo
+            "temperature": temperatura,  # Parámetro de aleatoriedad
+            "top_p": top_p,  # Parámetro de probabilidad acumulativa
+            "max_tokens": max_tokens,  # Límite de tokens en la respuesta
+        }
 
+    @cachear_respuesta
     def generar_respuesta(
         self,
         *,
@@ -29,57 +254,228 @@ class ModeloRemoto:
         temperatura: float = 0.7,
         top_p: float = 0.9,
         max_tokens: int,
+        parada: Callable[[str], bool] | None = None,
+        al_recibir: Callable[[str], None] | None = None,
     ) -> dict[str, Any]:
         """
         Envía una solicitud al modelo remoto para generar una respuesta de chat.
 
+        Si se indica parada o al_recibir, la respuesta se recibe en streaming.
+
         Parámetros:
         - mensajes: Lista de mensajes en formato dict con roles y contenido.
         - temperatura: Controla la aleatoriedad de las respuestas.
         - top_p: Controla la probabilidad acumulativa para la selección de palabras.
         - max_tokens: Número máximo de tokens en la respuesta.
+        - parada: Recibe el texto acumulado y devuelve True para cortar la generación.
+        - al_recibir: Se llama con cada fragmento de texto según llega.
 
         Retorna:
         - Respuesta JSON del modelo remoto.
         """
-        carga = {
-            "model": self.nombre_modelo,  # Especifica el modelo a usar
-            "messages": mensajes,  # Mensajes enviados al modelo
-            "temperature": temperatura,  # Parámetro de aleatoriedad
-            "top_p": top_p,  # Parámetro de probabilidad acumulativa
-            "max_tokens": max_tokens,  # Límite de tokens en la respuesta
-        }
+        carga = self._construir_carga(mensajes, temperatura, top_p, max_tokens)
+        transmitir = parada is not None or al_recibir is not None
+        if transmitir:
+            carga["stream"] = True  # El servidor envía eventos SSE con cada fragmento
         try:
-            respuesta = requests.post(
-                f"{self.url_base}/chat/completions",  # Endpoint para completar chats
-                headers=ENCABEZADOS,  # Encabezados HTTP
-                json=carga,  # Cuerpo de la solicitud en formato JSON
-                verify=False,  # Desactiva la verificación SSL
-                timeout=120,  # Tiempo máximo de espera para la solicitud
-            )
+            respuesta = self._enviar(carga)
+            try:
+                respuesta.raise_for_status()  # Lanza una excepción si la solicitud falla
+                if transmitir:
+                    return self._leer_transmision(respuesta, parada, al_recibir)
+                return _json_loads(respuesta.read())  # Retorna la respuesta en formato JSON
+            finally:
+                respuesta.close()  # También corta la generación si se paró antes de tiempo
+        except httpx.TimeoutException:
+            error = _respuesta_error("Error: Tiempo de espera excedido al consultar el modelo remoto.")
+        except httpx.HTTPError as e:
+            error = _respuesta_error(f"Error al consultar el modelo remoto: {e}")
+        except ValueError as e:  # El cuerpo de la respuesta no es JSON válido
+            error = _respuesta_error(f"Error al consultar el modelo remoto: {e}")
+        if al_recibir is not None:
+            al_recibir(error["choices"][0]["message"]["content"])
+        return error
+
+    def _enviar(self, carga: dict[str, Any]) -> httpx.Response:
+        """
+        Envía la solicitud de chat sin leer aún el cuerpo, reintentando con
+        retroceso exponencial los códigos de ESTADOS_REINTENTO.
+
+        Retorna:
+        - Respuesta abierta; el llamador debe cerrarla.
+        """
+        solicitud = self.cliente.build_request(
+            "POST",
+            f"{self.url_base}/chat/completions",  # Endpoint para completar chats
+            content=_json_dumps(carga),  # Cuerpo de la solicitud ya serializado en JSON
+        )
+        for intento in range(REINTENTOS_LLM + 1):
+            respuesta = self.cliente.send(solicitud, stream=True)
+            if respuesta.status_code not in ESTADOS_REINTENTO or intento == REINTENTOS_LLM:
+                break
+            respuesta.close()
+            time.sleep(FACTOR_ESPERA * 2 ** intento)  # Retroceso exponencial ante sobrecarga
+        return respuesta
+
+    @staticmethod
+    def _leer_transmision(
+        respuesta: httpx.Response,
+        parada: Callable[[str], bool] | None,
+        al_recibir: Callable[[str], None] | None,
+    ) -> dict[str, Any]:
+        """
+        Acumula los fragmentos de una respuesta en streaming (SSE).
+
+        Deja de leer en cuanto parada devuelve True; al cerrar la respuesta a
+        medias el servidor deja de generar tokens que no se van a usar.
+
+        Retorna:
+        - Respuesta JSON con la misma forma que la de una solicitud sin streaming.
+        """
+        texto = ""
+        motivo_fin = None
+        for linea in respuesta.iter_lines():
+            if not linea.startswith("data:"):
+                continue  # Líneas vacías o comentarios SSE
+            datos = linea[len("data:"):].strip()
+            if datos == "[DONE]":
+                break
+            evento = _json_loads(datos)
+            if not evento.get("choices"):  # Evento de error en mitad de la transmisión
+                raise ValueError(f"error en la transmisión: {evento.get('error', evento)}")
+            eleccion = evento["choices"][0]
+            motivo_fin = eleccion.get("finish_reason") or motivo_fin
+            fragmento = eleccion.get("delta", {}).get("content") or ""
+            if not fragmento:
+                continue
+            texto += fragmento
+            if al_recibir is not None:
+                al_recibir(fragmento)
+            if parada is not None and parada(texto):
+                break
+        return {"choices": [{"message": {"role": "assistant", "content": texto}, "finish_reason": motivo_fin}]}
+
+    @cachear_respuesta
+    async def generar_respuesta_async(
+        self,
+        *,
+        mensajes: list[dict[str, str]],
+        temperatura: float = 0.7,
+        top_p: float = 0.9,
+        max_tokens: int,
+        cliente: httpx.AsyncClient | None = None,
+    ) -> dict[str, Any]:
+        """
+        Versión asíncrona de generar_respuesta basada en httpx.
+
+        Parámetros:
+        - mensajes, temperatura, top_p, max_tokens: Igual que en generar_respuesta.
+        - cliente: Cliente asíncrono compartido; si no se indica se abre uno para esta solicitud.
+
+        Retorna:
+        - Respuesta JSON del modelo remoto.
+        """
+        carga = self._construir_carga(mensajes, temperatura, top_p, max_tokens)
+        if cliente is None:
+            async with self.crear_cliente_async() as cliente:
+                return await self._enviar_async(carga, cliente)
+        return await self._enviar_async(carga, cliente)
+
+    async def _enviar_async(self, carga: dict[str, Any], cliente: httpx.AsyncClient) -> dict[str, Any]:
+        """Envía la solicitud de chat con el cliente asíncrono, reintentando los códigos de ESTADOS_REINTENTO."""
+        try:
+            for intento in range(REINTENTOS_LLM + 1):
+                respuesta = await cliente.post(f"{self.url_base}/chat/completions", content=_json_dumps(carga))
+                if respuesta.status_code not in ESTADOS_REINTENTO or intento == REINTENTOS_LLM:
+                    break
+                await asyncio.sleep(FACTOR_ESPERA * 2 ** intento)  # Retroceso exponencial ante sobrecarga
             respuesta.raise_for_status()  # Lanza una excepción si la solicitud falla
-            return respuesta.json()  # Retorna la respuesta en formato JSON
-        except requests.exceptions.Timeout:
-            return {"choices": [{"message": {"content": "Error: Tiempo de espera excedido al consultar el modelo remoto."}}]}
-        except requests.exceptions.RequestException as e:
-            return {"choices": [{"message": {"content": f"Error al consultar el modelo remoto: {e}"}}]}
+            return _json_loads(respuesta.content)  # Retorna la respuesta en formato JSON
+        except httpx.TimeoutException:
+            return _respuesta_error("Error: Tiempo de espera excedido al consultar el modelo remoto.")
+        except httpx.HTTPError as e:
+            return _respuesta_error(f"Error al consultar el modelo remoto: {e}")
+        except ValueError as e:  # El cuerpo de la respuesta no es JSON válido
+            return _respuesta_error(f"Error al consultar el modelo remoto: {e}")
+
+    async def generar_lote(
+        self,
+        lista_mensajes: list[list[dict[str, str]]],
+        *,
+        temperatura: float = 0.7,
+        top_p: float = 0.9,
+        max_tokens: int,
+        semantica: bool = False,
+    ) -> list[dict[str, Any]]:
+        """
+        Envía varias conversaciones al modelo de forma concurrente, con como
+        mucho VENTANA_CONCURRENCIA solicitudes en curso.
+
+        Parámetros:
+        - lista_mensajes: Una lista de mensajes por cada conversación.
+        - temperatura, top_p, max_tokens: Igual que en generar_respuesta.
+        - semantica: Permite reutilizar de la caché respuestas a preguntas parecidas.
+
+        Retorna:
+        - Respuestas JSON en el mismo orden que lista_mensajes.
+        """
+        respuestas: list[dict[str, Any]] = [{}] * len(lista_mensajes)
+        async with self.crear_cliente_async() as cliente:
+            async for indice, respuesta in ventana_concurrente(
+                lambda mensajes: self.generar_respuesta_async(
+                    mensajes=mensajes,
+                    temperatura=temperatura,
+                    top_p=top_p,
+                    max_tokens=max_tokens,
+                    semantica=semantica,
+                    cliente=cliente,
+                ),
+                lista_mensajes,
+            ):
+                respuestas[indice] = respuesta
+        return respuestas
+
+    @staticmethod
+    def crear_cliente_async() -> httpx.AsyncClient:
+        """Crea un cliente asíncrono ligado al bucle de eventos actual."""
+        return httpx.AsyncClient(
+            headers=ENCABEZADOS,
+            timeout=120,
+            transport=httpx.AsyncHTTPTransport(http2=True, verify=False, limits=LIMITES_HTTP, retries=REINTENTOS_LLM),
+        )
 
 # ---------------------------------------------------------------------------
 # Funciones de base de datos
 # ---------------------------------------------------------------------------
 
+RUTA_CACHE_CONFIG = os.path.join(os.path.expanduser("~"), ".cache", "ddbb_llm", "config.json")  # Config ya leída
+
+
 def cargar_config_bd(archivo: str) -> dict[str, str]:
     """
     Carga la configuración de la base de datos desde un archivo docker-compose.yml.
 
+    El resultado se guarda en RUTA_CACHE_CONFIG junto con la fecha de
+    modificación del archivo, de modo que solo se vuelve a leer el YAML
+    cuando este cambia.
+
     Parámetros:
     - archivo: Ruta al archivo docker-compose.yml.
 
     Retorna:
     - Diccionario con la configuración de la base de datos.
     """
+    ruta = os.path.abspath(archivo)
+    modificacion = os.stat(ruta).st_mtime_ns
+    try:
+        with open(RUTA_CACHE_CONFIG, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if cache["archivo"] == ruta and cache["modificacion"] == modificacion:
+            return cache["config"]
+    except (OSError, ValueError, KeyError):
+        pass  # Sin caché válida: se lee el YAML
     with open(archivo, 'r') as f:
-        docker_compose = yaml.safe_load(f)  # Carga el archivo YAML
+        docker_compose = yaml.load(f, Loader=YamlSafeLoader)  # Carga el archivo YAML
         puertos = docker_compose['services']['mysql']['ports']  # Obtiene los puertos configurados
         entorno = docker_compose['services']['mysql']['environment']  # Obtiene las variables de entorno
     config_bd = {
@@ -89,50 +485,138 @@ def cargar_config_bd(archivo: str) -> dict[str, str]:
         "password": str(entorno['MYSQL_PASSWORD']),  # Contraseña del usuario
         "database": entorno['MYSQL_DATABASE'],  # Nombre de la base de datos
     }
+    try:
+        os.makedirs(os.path.dirname(RUTA_CACHE_CONFIG), mode=0o700, exist_ok=True)
+        # Incluye la contraseña: el archivo solo debe poder leerlo su dueño
+        descriptor = os.open(RUTA_CACHE_CONFIG, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        if hasattr(os, "fchmod"):
+            os.fchmod(descriptor, 0o600)  # Corrige los permisos de un archivo creado por versiones anteriores
+        with open(descriptor, 'w', encoding='utf-8') as f:
+            json.dump({"archivo": ruta, "modificacion": modificacion, "config": config_bd}, f)
+    except OSError:
+        pass  # La caché es opcional
     return config_bd
 
-def conectar_bd(config: dict[str, str]):
+
+NOMBRE_POOL_BD = "ddbb"  # Nombre del pool de conexiones MySQL
+TAMANO_POOL_BD = 8  # Conexiones simultáneas a la base de datos
+
+
+def conectar_bd(config: dict[str, str]) -> pooling.MySQLConnectionPool:
     """
-    Conecta a la base de datos MySQL usando la configuración proporcionada.
+    Crea un pool de conexiones a la base de datos MySQL usando la configuración proporcionada.
 
     Parámetros:
     - config: Diccionario con la configuración de la base de datos.
 
     Retorna:
-    - Conexión a la base de datos.
+    - Pool de conexiones; cada operación toma una con get_connection().
     """
-    return mysql.connector.connect(**config)  # Establece la conexión usando los parámetros
+    return pooling.MySQLConnectionPool(  # Abre TAMANO_POOL_BD conexiones con los parámetros
+        pool_name=NOMBRE_POOL_BD, pool_size=TAMANO_POOL_BD, pool_reset_session=True, **config
+    )
+
 
-def obtener_descripcion_esquema(conexion, base_datos) -> str:
+_CACHE_ESQUEMAS: dict[tuple[str, str, str], str] = {}  # Descripciones leídas por (host, puerto, base de datos)
+
+
+def obtener_descripcion_esquema(pool, config: dict[str, str]) -> str:
     """
-    Devuelve una descripción del esquema de la base de datos.
+    Devuelve una descripción del esquema de la base de datos, leyéndola solo
+    la primera vez por servidor y base de datos (ver refrescar_esquema).
 
     Parámetros:
-    - conexion: Conexión a la base de datos.
+    - pool: Pool de conexiones a la base de datos.
+    - config: Configuración con la que se creó el pool (host, puerto y base de datos).
+
+    Retorna:
+    - Cadena con la descripción del esquema.
+    """
+    base_datos = config['database']
+    clave = (config['host'], str(config['port']), base_datos)
+    descripcion = _CACHE_ESQUEMAS.get(clave)
+    if descripcion is None:
+        descripcion = _leer_descripcion_esquema(pool, base_datos)
+        _CACHE_ESQUEMAS[clave] = descripcion  # SIGHUP puede vaciar la caché en cualquier momento
+    return descripcion
+
+
+def refrescar_esquema() -> None:
+    """Descarta las descripciones de esquema guardadas para que se vuelvan a leer."""
+    _CACHE_ESQUEMAS.clear()
+
+
+def _leer_descripcion_esquema(pool, base_datos) -> str:
+    """
+    Lee de information_schema la descripción del esquema de la base de datos.
+    Si la consulta conjunta falla, recurre a consultas por tabla en paralelo.
+
+    Parámetros:
+    - pool: Pool de conexiones a la base de datos.
     - base_datos: Nombre de la base de datos.
 
     Retorna:
     - Cadena con la descripción del esquema.
     """
-    with conexion.cursor() as cursor:
-        cursor.execute("SELECT table_name FROM information_schema.tables")  # Obtiene los nombres de las tablas
-        tablas = cursor.fetchall()  # Recupera los resultados
-        descripcion = f"Esquema de {base_datos}:\n"  # Encabezado del esquema
-        for (tabla,) in tablas:
-            descripcion += f"Tabla: {tabla}\nColumnas:\n"  # Agrega el nombre de la tabla
+    try:
+        with pool.get_connection() as conexion, conexion.cursor() as cursor:
+            cursor.execute(
+                "SELECT table_name, column_name, data_type FROM information_schema.columns "
+                "WHERE table_schema = %s ORDER BY table_name, ordinal_position;",
+                (base_datos,),  # Obtiene todas las columnas del esquema en una sola consulta
+            )
+            filas = cursor.fetchall()  # Recupera los resultados
+    except mysql.connector.Error:
+        filas = _leer_columnas_por_tabla(pool, base_datos)
+    partes = [f"Esquema de {base_datos}:\n"]  # Encabezado del esquema
+    for tabla, columnas in groupby(filas, key=itemgetter(0)):
+        partes.append(f"Tabla: {tabla}\nColumnas:\n")  # Agrega el nombre de la tabla
+        for _, columna, tipo_dato in columnas:
+            partes.append(f"  - {columna} ({tipo_dato})\n")  # Agrega las columnas y sus tipos
+        partes.append("\n")
+    return "".join(partes)  # Retorna la descripción completa
+
+
+def _leer_columnas_por_tabla(pool, base_datos) -> list[tuple[str, str, str]]:
+    """
+    Alternativa a la consulta conjunta: lee las columnas con una consulta por
+    tabla, lanzadas en paralelo con una conexión del pool por hilo.
+
+    Parámetros:
+    - pool: Pool de conexiones a la base de datos.
+    - base_datos: Nombre de la base de datos.
+
+    Retorna:
+    - Filas (tabla, columna, tipo de dato) ordenadas por tabla y posición.
+    """
+    with pool.get_connection() as conexion, conexion.cursor() as cursor:
+        cursor.execute(
+            "SELECT table_name FROM information_schema.tables WHERE table_schema = %s ORDER BY table_name;",
+            (base_datos,),  # Obtiene los nombres de las tablas
+        )
+        tablas = [tabla for (tabla,) in cursor.fetchall()]
+
+    def leer_columnas(tabla: str) -> list[tuple[str, str, str]]:
+        with pool.get_connection() as conexion_tabla, conexion_tabla.cursor() as cursor:
             cursor.execute(
-                "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = %s;",
-                (tabla,),  # Obtiene las columnas de la tabla
+                "SELECT column_name, data_type FROM information_schema.columns "
+                "WHERE table_schema = %s AND table_name = %s ORDER BY ordinal_position;",
+                (base_datos, tabla),  # Obtiene las columnas de la tabla
             )
-            for columna, tipo_dato in cursor.fetchall():
-                descripcion += f"  - {columna} ({tipo_dato})\n"  # Agrega las columnas y sus tipos
-            descripcion += "\n"
-    return descripcion  # Retorna la descripción completa
+            return [(tabla, columna, tipo_dato) for columna, tipo_dato in cursor.fetchall()]
+
+    # Un hilo por conexión del pool: get_connection() falla en lugar de esperar si se agota
+    with ThreadPoolExecutor(max_workers=pool.pool_size) as ejecutor:
+        futuros = {tabla: ejecutor.submit(leer_columnas, tabla) for tabla in tablas}
+    return [fila for tabla in tablas for fila in futuros[tabla].result()]  # Orden determinista
 
 # ---------------------------------------------------------------------------
 # Utilidades de texto
 # ---------------------------------------------------------------------------
 
+_MARKDOWN_RE = re.compile(r"\*\*(.+?)\*\*|__(.+?)__|\*(.+?)\*|_(.+?)_|`(.+?)`")  # Negrita, cursiva y código
+
+
 def limpiar_markdown(texto: str) -> str:
     """
     Elimina caracteres básicos de formato Markdown.
@@ -143,67 +627,218 @@ def limpiar_markdown(texto: str) -> str:
     Retorna:
     - Texto limpio sin formato Markdown.
     """
-    patrones = [r"\*\*(.+?)\*\*", r"__(.+?)__", r"\*(.+?)\*", r"_(.+?)_", r"`(.+?)`"]  # Patrones de Markdown
-    for patron in patrones:
-        texto = re.sub(patron, r"\1", texto)  # Reemplaza los patrones por texto limpio
-    return texto.strip()  # Retorna el texto limpio y sin espacios extra
+    return limpiar_markdown_linea(texto).strip()  # Retorna el texto limpio y sin espacios extra
+
+
+def limpiar_markdown_linea(texto: str) -> str:
+    """Elimina el formato Markdown de un texto sin recortar sus espacios."""
+    cambios = 1
+    while cambios:  # Se repite para los marcadores anidados, como en **_x_**
+        texto, cambios = _MARKDOWN_RE.subn(lambda m: next(g for g in m.groups() if g is not None), texto)
+    return texto
 
 # ---------------------------------------------------------------------------
 # Funciones que interactúan con el LLM
 # ---------------------------------------------------------------------------
 
-def generar_sql(esquema: str, pregunta: str, modelo: ModeloRemoto) -> str:
-    """Genera una consulta SQL basada en el esquema y la pregunta."""
-    mensajes = [
+TAMANO_LOTE_SQL = 5  # Preguntas que se agrupan en una misma solicitud al modelo
+MAX_TOKENS_SQL = 256  # Presupuesto por consulta SQL; las consultas son cortas
+MAX_TOKENS_REINTENTO = 1024  # Presupuesto por consulta al reintentar una respuesta cortada
+MAX_TOKENS_RESPUESTA = 512  # Presupuesto de la respuesta en lenguaje natural
+_SQL_FENCE_RE = re.compile(r"^\s*```(?:sql)?\s*|\s*```\s*$", re.I)  # Bloque de código al inicio o al final
+_SQL_LOTE_RE = re.compile(r"\[(\d+)\]\s*(.+?)(?=\n\[\d+\]|\Z)", re.S)  # Consultas numeradas "[i] SELECT ..."
+SYSTEM_SQL = (
+    "You are an expert in SQL and MySQL. Generate an SQL query to answer each of the user's questions, "
+    "which are numbered like \"[1] ...\". Use only the available tables and columns. Return only the queries, "
+    "without any formatting, one per question and each one prefixed with its marker, like \"[1] SELECT ...\"."
+)
+
+
+def _mensajes_sql(esquema: str, preguntas: list[str]) -> list[dict[str, str]]:
+    """
+    Construye los mensajes para pedir una consulta SQL por cada pregunta, numeradas con [i].
+
+    El esquema va en el mensaje de sistema, idéntico entre llamadas, para que el
+    servidor pueda reutilizar la caché de prefijo; solo cambian las preguntas.
+    """
+    enumeradas = "\n".join(f"[{i}] {pregunta}" for i, pregunta in enumerate(preguntas, start=1))
+    return [
         {
         "role": "system",
-        "content": "You are an expert in SQL and MySQL."
+        "content": SYSTEM_SQL + "\n\nSchema:\n" + esquema
         },
         {
         "role": "user",
-        "content": (
-            "Given the following schema:\n" + esquema + "\n\n"
-            f"Generate an SQL query to answer the question: {pregunta}. "
-            "Use only the available tables and columns and return only the query, without any formatting."
-        ),
+        "content": enumeradas,
         }
     ]
-    respuesta = modelo.generar_respuesta(mensajes=mensajes, temperatura=0.1, top_p=0.9, max_tokens=4096)
-    sql = respuesta["choices"][0]["message"]["content"].strip()
-    return re.sub(r"```sql\s*|\s*```", "", sql)
 
 
-def ejecutar_sql(conexion, consulta: str) -> List[Any]:
-    """Ejecuta la consulta y maneja errores."""
-    cursor = conexion.cursor()
+def _extraer_sql(
+    respuesta: dict[str, Any], cantidad: int, al_fallar: Callable[[str], None] | None = None
+) -> list[str]:
+    """
+    Obtiene las consultas SQL numeradas del contenido devuelto por el modelo.
+
+    Parámetros:
+    - respuesta: Respuesta JSON del modelo remoto.
+    - cantidad: Número de preguntas enviadas.
+    - al_fallar: Se llama con el mensaje de error si la solicitud al modelo falló.
+
+    Retorna:
+    - Lista con una consulta por pregunta (cadena vacía si el modelo no la devolvió).
+    """
+    contenido = respuesta["choices"][0]["message"]["content"]
+    if respuesta.get("error"):
+        if al_fallar is not None:
+            al_fallar(contenido)  # El contenido es el mensaje de error, no una consulta
+        return [""] * cantidad
+    texto = _SQL_FENCE_RE.sub("", contenido).strip()
+    consultas = {int(indice): _SQL_FENCE_RE.sub("", sql).strip() for indice, sql in _SQL_LOTE_RE.findall(texto)}
+    if not consultas and cantidad == 1:
+        return [texto]  # El modelo omitió el marcador en una pregunta suelta
+    return [consultas.get(i, "") for i in range(1, cantidad + 1)]
+
+
+def _truncada(respuesta: dict[str, Any]) -> bool:
+    """Indica si el modelo dejó la respuesta a medias por agotar max_tokens."""
+    return respuesta["choices"][0].get("finish_reason") == "length"
+
+
+def _sql_completo(texto: str, cantidad: int) -> bool:
+    """
+    Indica si el texto recibido ya contiene las `cantidad` consultas pedidas,
+    es decir, si la última termina en ";" o cierra su bloque de código.
+    """
+    marcador = f"[{cantidad}]"
+    if cantidad > 1 and marcador not in texto:
+        return False  # La última consulta ni siquiera ha empezado
+    ultima = texto.rsplit(marcador, 1)[-1].rstrip()
+    if ultima.endswith("```") and texto.count("```") % 2 == 0:
+        return True  # Se cerró el bloque de código, no solo se abrió
+    return ultima.endswith(";")
+
+
+def generar_sql_lote(
+    esquema: str, preguntas: list[str], modelo: ModeloRemoto, al_fallar: Callable[[str], None] | None = None
+) -> list[str]:
+    """Genera con una sola llamada al modelo una consulta SQL por cada pregunta."""
+    mensajes = _mensajes_sql(esquema, preguntas)
+    for max_tokens in (MAX_TOKENS_SQL, MAX_TOKENS_REINTENTO):  # Solo se amplía si la consulta quedó cortada
+        respuesta = modelo.generar_respuesta(
+            mensajes=mensajes,
+            temperatura=0.1,
+            top_p=0.9,
+            max_tokens=max_tokens * len(preguntas),
+            parada=functools.partial(_sql_completo, cantidad=len(preguntas)),  # Corta al terminar la última consulta
+            semantica=len(preguntas) == 1,  # Con varias preguntas, cambiar una apenas mueve el embedding
+        )
+        if not _truncada(respuesta):
+            break
+    return _extraer_sql(respuesta, len(preguntas), al_fallar)
+
+
+def generar_sql(
+    esquema: str, pregunta: str, modelo: ModeloRemoto, al_fallar: Callable[[str], None] | None = None
+) -> str:
+    """Genera una consulta SQL basada en el esquema y la pregunta."""
+    return generar_sql_lote(esquema, [pregunta], modelo, al_fallar)[0]
+
+
+async def generar_sql_async(
+    esquema: str,
+    pregunta: str,
+    modelo: ModeloRemoto,
+    cliente: httpx.AsyncClient | None = None,
+    al_fallar: Callable[[str], None] | None = None,
+) -> str:
+    """Versión asíncrona de generar_sql."""
+    mensajes = _mensajes_sql(esquema, [pregunta])
+    for max_tokens in (MAX_TOKENS_SQL, MAX_TOKENS_REINTENTO):
+        respuesta = await modelo.generar_respuesta_async(
+            mensajes=mensajes, temperatura=0.1, top_p=0.9, max_tokens=max_tokens, semantica=True, cliente=cliente
+        )
+        if not _truncada(respuesta):
+            break
+    return _extraer_sql(respuesta, 1, al_fallar)[0]
+
+
+def generar_sql_varias(
+    esquema: str, preguntas: list[str], modelo: ModeloRemoto, al_fallar: Callable[[str], None] | None = None
+) -> list[str]:
+    """Genera las consultas SQL en grupos de TAMANO_LOTE_SQL preguntas, enviando los grupos en paralelo."""
+    grupos = [preguntas[i:i + TAMANO_LOTE_SQL] for i in range(0, len(preguntas), TAMANO_LOTE_SQL)]
+    lista_mensajes = [_mensajes_sql(esquema, grupo) for grupo in grupos]
+    respuestas = asyncio.run(
+        modelo.generar_lote(
+            lista_mensajes,
+            temperatura=0.1,
+            top_p=0.9,
+            max_tokens=MAX_TOKENS_SQL * TAMANO_LOTE_SQL,
+            semantica=len(preguntas) == 1,  # Solo si el grupo es una pregunta suelta
+        )
+    )
+    truncadas = [i for i, respuesta in enumerate(respuestas) if _truncada(respuesta)]
+    if truncadas:
+        reintentos = asyncio.run(modelo.generar_lote(
+            [lista_mensajes[i] for i in truncadas],
+            temperatura=0.1,
+            top_p=0.9,
+            max_tokens=MAX_TOKENS_REINTENTO * TAMANO_LOTE_SQL,
+            semantica=len(preguntas) == 1,
+        ))
+        for i, respuesta in zip(truncadas, reintentos):
+            respuestas[i] = respuesta
+    return [
+        sql for grupo, respuesta in zip(grupos, respuestas) for sql in _extraer_sql(respuesta, len(grupo), al_fallar)
+    ]
+
+
+MAX_FILAS_LLM = 200  # Filas máximas del resultado que se envían al modelo
+TAMANO_BLOQUE_FILAS = 500  # Filas que se leen del servidor en cada fetchmany
+_SELECT_RE = re.compile(r"\s*select\b", re.I)  # Comprueba solo el inicio, sin copiar la consulta en minúsculas
+
+
+def ejecutar_sql(pool, consulta: str) -> List[Any]:
+    """
+    Ejecuta la consulta con una conexión del pool, lee las filas por bloques
+    hasta MAX_FILAS_LLM y maneja errores.
+    """
+    if not _SELECT_RE.match(consulta):
+        return ["La consulta SQL debe ser un SELECT."]  # Se rechaza sin llegar a ejecutarla
     try:
-        cursor.execute(consulta)
-        if consulta.strip().lower().startswith("select"):
-            resultado = cursor.fetchall()
-            if resultado is None or len(resultado) == 0:
+        with pool.get_connection() as conexion, conexion.cursor(buffered=False) as cursor:
+            cursor.execute(consulta)
+            resultado = []
+            omitidas = 0
+            while bloque := cursor.fetchmany(TAMANO_BLOQUE_FILAS):
+                libres = MAX_FILAS_LLM - len(resultado)
+                resultado.extend(bloque[:libres])
+                omitidas += max(len(bloque) - libres, 0)  # Se consumen sin guardarlas
+            if len(resultado) == 0:
                 return ["No se encontraron resultados."]
+            if omitidas:
+                resultado.append(f"(truncado, {omitidas} filas más)")
             return resultado
-        else:
-            return ["La consulta SQL debe ser un SELECT."]
-    except Exception as e:
+    except mysql.connector.Error as e:
         return [f"Error al ejecutar la consulta SQL: {str(e)}"]
 
 
 def formatear_resultado(resultado: List[Any]) -> str:
     """Convierte la lista/tuplas en una cadena legible."""
     if len(resultado) == 1:
-        resultado_formateado = resultado[0]
-    else:
-        resultado_formateado = "\n".join([
-            f"{i+1}. {', '.join(str(v) for v in fila)}"
-            for i, fila in enumerate(resultado)
-        ])
-    return resultado_formateado
-
-
-def generar_respuesta_natural(pregunta: str, resultado: str, modelo: ModeloRemoto) -> str:
-    """Genera una respuesta en lenguaje natural basada en la pregunta y el resultado."""
-    mensajes = [
+        return resultado[0]
+    if len(resultado[0]) == 1:  # Una sola columna: sin numeración ni separadores
+        return "\n".join(fila if isinstance(fila, str) else str(fila[0]) for fila in resultado)
+    return "\n".join(
+        fila if isinstance(fila, str) else f"{i+1}. {', '.join(map(str, fila))}"
+        for i, fila in enumerate(resultado)
+    )
+
+
+def _mensajes_respuesta_natural(pregunta: str, resultado: str) -> list[dict[str, str]]:
+    """Construye los mensajes para pedir la respuesta en lenguaje natural."""
+    return [
         {
             "role": "system",
             "content": (
@@ -213,39 +848,258 @@ def generar_respuesta_natural(pregunta: str, resultado: str, modelo: ModeloRemot
         },
         {"role": "user", "content": f"Pregunta: {pregunta}\nDatos: {resultado}"},
     ]
-    respuesta = modelo.generar_respuesta(mensajes=mensajes, temperatura=0.3, top_p=0.9, max_tokens=4096)
+
+
+def generar_respuesta_natural(
+    pregunta: str, resultado: str, modelo: ModeloRemoto, al_recibir: Callable[[str], None] | None = None
+) -> str:
+    """
+    Genera una respuesta en lenguaje natural basada en la pregunta y el resultado.
+    Si se indica al_recibir, se le entregan los fragmentos según los genera el modelo.
+    """
+    mensajes = _mensajes_respuesta_natural(pregunta, resultado)
+    respuesta = modelo.generar_respuesta(
+        mensajes=mensajes, temperatura=0.3, top_p=0.9, max_tokens=MAX_TOKENS_RESPUESTA, al_recibir=al_recibir
+    )
     return limpiar_markdown(respuesta["choices"][0]["message"]["content"])
 
 
+async def generar_respuesta_natural_async(
+    pregunta: str, resultado: str, modelo: ModeloRemoto, cliente: httpx.AsyncClient | None = None
+) -> str:
+    """Versión asíncrona de generar_respuesta_natural."""
+    mensajes = _mensajes_respuesta_natural(pregunta, resultado)
+    respuesta = await modelo.generar_respuesta_async(
+        mensajes=mensajes, temperatura=0.3, top_p=0.9, max_tokens=MAX_TOKENS_RESPUESTA, cliente=cliente
+    )
+    return limpiar_markdown(respuesta["choices"][0]["message"]["content"])
+
+
+# ---------------------------------------------------------------------------
+# Procesamiento por lotes
+# ---------------------------------------------------------------------------
+
+async def ventana_concurrente(
+    funcion: Callable[[Any], Awaitable[Any]],
+    elementos: Iterable[Any],
+    limite: int = VENTANA_CONCURRENCIA,
+) -> AsyncIterator[tuple[int, Any]]:
+    """
+    Ejecuta funcion(elemento) para cada elemento con como mucho `limite`
+    tareas en curso, lanzando la siguiente en cuanto termina otra. Las tareas
+    se crean a medida que hay hueco, no todas de golpe.
+
+    Parámetros:
+    - funcion: Corrutina que procesa un elemento.
+    - elementos: Elementos a procesar.
+    - limite: Número máximo de tareas simultáneas.
+
+    Retorna:
+    - Pares (índice, resultado) en orden de finalización.
+    """
+    pendientes = enumerate(elementos)
+    en_curso = {asyncio.ensure_future(funcion(elemento)): indice for indice, elemento in islice(pendientes, limite)}
+    try:
+        while en_curso:
+            terminadas, _ = await asyncio.wait(en_curso, return_when=asyncio.FIRST_COMPLETED)
+            for tarea in terminadas:
+                yield en_curso.pop(tarea), tarea.result()
+            for indice, elemento in islice(pendientes, len(terminadas)):
+                en_curso[asyncio.ensure_future(funcion(elemento))] = indice
+    finally:
+        # Si una tarea falla o se abandona la iteración, las demás no deben quedar sueltas
+        for tarea in en_curso:
+            tarea.cancel()
+        await asyncio.gather(*en_curso, return_exceptions=True)
+
+
+async def procesar_pregunta(
+    pregunta: str,
+    esquema: str,
+    modelo: ModeloRemoto,
+    pool,
+    *,
+    cliente: httpx.AsyncClient,
+    semaforo_bd: asyncio.Semaphore,
+) -> tuple[str, str, str]:
+    """
+    Resuelve una pregunta completa: SQL, ejecución y respuesta natural.
+
+    Parámetros:
+    - pregunta: Pregunta del usuario.
+    - esquema: Descripción del esquema de la base de datos.
+    - modelo: Modelo remoto.
+    - pool: Pool de conexiones a la base de datos.
+    - cliente: Cliente asíncrono compartido por todo el lote.
+    - semaforo_bd: Limita las consultas simultáneas al tamaño del pool.
+
+    Retorna:
+    - Tupla (sql, resultado, respuesta).
+    """
+    errores: list[str] = []
+    sql = await generar_sql_async(esquema, pregunta, modelo, cliente, al_fallar=errores.append)
+    if not sql:
+        return "", "\n".join(["No se pudo generar la consulta.", *errores]), ""
+    bucle = asyncio.get_running_loop()
+    async with semaforo_bd:
+        filas = await bucle.run_in_executor(None, ejecutar_sql, pool, sql)
+    resultado = formatear_resultado(filas)
+    respuesta = await generar_respuesta_natural_async(pregunta, resultado, modelo, cliente)
+    return sql, resultado, respuesta
+
+
+async def procesar_lote(
+    preguntas: list[str], esquema: str, modelo: ModeloRemoto, pool, concurrencia: int
+) -> list[tuple[str, str, str]]:
+    """
+    Procesa las preguntas con como mucho `concurrencia` en curso y devuelve
+    los resultados en el orden de las preguntas.
+    """
+    semaforo_bd = asyncio.Semaphore(pool.pool_size)
+    resultados: list[tuple[str, str, str]] = [("", "", "")] * len(preguntas)
+    async with modelo.crear_cliente_async() as cliente:
+        async for indice, resultado in ventana_concurrente(
+            lambda pregunta: procesar_pregunta(
+                pregunta, esquema, modelo, pool, cliente=cliente, semaforo_bd=semaforo_bd
+            ),
+            preguntas,
+            concurrencia,
+        ):
+            resultados[indice] = resultado
+    return resultados
+
+
 # ---------------------------------------------------------------------------
 # Programa principal
 # ---------------------------------------------------------------------------
 
+class ImpresorSinMarkdown:
+    """
+    Muestra una respuesta en streaming línea a línea, limpiando el Markdown.
+
+    Se espera a tener cada línea completa porque un marcador como ** puede
+    llegar partido entre fragmentos; _MARKDOWN_RE no cruza saltos de línea,
+    así que el resultado coincide con el de limpiar_markdown.
+    """
+    def __init__(self):
+        self._pendiente = ""  # Texto de la línea aún sin terminar
+        self._inicio = True  # Omite los espacios iniciales, como limpiar_markdown
+
+    def __call__(self, fragmento: str) -> None:
+        self._pendiente += fragmento
+        if self._inicio:
+            self._pendiente = self._pendiente.lstrip()
+            self._inicio = not self._pendiente
+        *lineas, self._pendiente = self._pendiente.split("\n")
+        for linea in lineas:
+            print(limpiar_markdown_linea(linea), flush=True)
+
+    def terminar(self) -> None:
+        """Muestra lo que quede de la última línea."""
+        print(limpiar_markdown_linea(self._pendiente.rstrip()), flush=True)
+        self._pendiente = ""
+
+
+def leer_preguntas_lote() -> list[str]:
+    """Lee preguntas, una por línea, hasta encontrar una línea vacía."""
+    print("Pega las preguntas, una por línea, y termina con una línea vacía:")
+    preguntas = []
+    while linea := input().strip():
+        preguntas.append(linea)
+    return preguntas
+
+
+def entero_positivo(valor: str) -> int:
+    """Convierte un argumento en un entero mayor o igual que 1."""
+    try:
+        numero = int(valor)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{valor}' no es un número entero") from None
+    if numero < 1:
+        raise argparse.ArgumentTypeError(f"debe ser al menos 1, no {numero}")
+    return numero
+
+
+def leer_argumentos() -> argparse.Namespace:
+    """Lee los argumentos de la línea de comandos."""
+    analizador = argparse.ArgumentParser(description="Consulta una base de datos MySQL en lenguaje natural.")
+    analizador.add_argument("--batch", metavar="ARCHIVO", help="Archivo con una pregunta por línea.")
+    analizador.add_argument(
+        "--concurrencia", type=entero_positivo, default=4, help="Preguntas simultáneas en modo --batch (por defecto 4)."
+    )
+    return analizador.parse_args()
+
+
+def ejecutar_archivo_lote(archivo: str, esquema: str, modelo: ModeloRemoto, pool, concurrencia: int) -> None:
+    """Procesa todas las preguntas de un archivo y muestra los resultados."""
+    with open(archivo, 'r', encoding='utf-8') as f:
+        preguntas = [linea.strip() for linea in f if linea.strip()]
+    resultados = asyncio.run(procesar_lote(preguntas, esquema, modelo, pool, concurrencia))
+    for pregunta, (sql, resultado, respuesta) in zip(preguntas, resultados):
+        print(f"\nPregunta: {pregunta}")
+        print(f"\nSQL Generado:\n{sql}\n")
+        print(f"Resultado:\n{resultado}\n")
+        print(f"Respuesta:\n{respuesta}\n")
+
+
 def main() -> None:
+    argumentos = leer_argumentos()
     config_bd = cargar_config_bd("docker-compose.yml")
-    with conectar_bd(config_bd) as conexion:
-        esquema = obtener_descripcion_esquema(conexion, config_bd['database'])
-        print("Esquema cargado con éxito.")
-        modelo = ModeloRemoto(URL_BASE_LM, NOMBRE_MODELO)
-        print("Modelo cargado con éxito.")
-        while True:
-            pregunta = input("Introduce tu pregunta (o 'exit'): ").strip()
-            if pregunta.lower() == "exit":
-                break
-            if not pregunta:
-                print("Pregunta vacía.")
-                continue
+    pool = conectar_bd(config_bd)
+    esquema = obtener_descripcion_esquema(pool, config_bd)
+    print("Esquema cargado con éxito.")
+    modelo = ModeloRemoto(URL_BASE_LM, NOMBRE_MODELO)
+    print("Modelo cargado con éxito.")
+    if argumentos.batch:
+        ejecutar_archivo_lote(argumentos.batch, esquema, modelo, pool, argumentos.concurrencia)
+        return
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda *_: refrescar_esquema())  # Recarga el esquema en la siguiente pregunta
+    while True:
+        pregunta = input(
+            "Introduce tu pregunta (o 'exit', '/lote' para varias, '/refresh' recarga el esquema, "
+            "'/olvidar' vacía la caché del modelo): "
+        ).strip()
+        if pregunta.lower() == "exit":
+            break
+        if not pregunta:
+            print("Pregunta vacía.")
+            continue
+        if pregunta.lower() == "/refresh":
+            refrescar_esquema()
+            obtener_descripcion_esquema(pool, config_bd)
+            print("Esquema recargado con éxito.")
+            continue
+        if pregunta.lower() == "/olvidar":
+            if modelo.cache is not None:
+                modelo.cache.vaciar()  # Evita repetir una consulta SQL errónea guardada
+            print("Caché del modelo vaciada.")
+            continue
+
+        esquema = obtener_descripcion_esquema(pool, config_bd)
+
+        if pregunta.lower() == "/lote":
+            preguntas = leer_preguntas_lote()
+            sqls = generar_sql_varias(esquema, preguntas, modelo, al_fallar=print)
+        else:
+            preguntas = [pregunta]
+            sqls = [generar_sql(esquema, pregunta, modelo, al_fallar=print)]
 
-            sql = generar_sql(esquema, pregunta, modelo)
-            if not sql: 
-                sql = "No se pudo generar la consulta."
+        for pregunta, sql in zip(preguntas, sqls):
+            if len(preguntas) > 1:
+                print(f"\nPregunta: {pregunta}")
+            if not sql:
+                print("No se pudo generar la consulta.")
                 continue
 
             print(f"\nSQL Generado:\n{sql}\n")
-            resultado = formatear_resultado(ejecutar_sql(conexion, sql))
+            resultado = formatear_resultado(ejecutar_sql(pool, sql))
             print(f"Resultado:\n{resultado}\n")
-            respuesta = generar_respuesta_natural(pregunta, resultado, modelo)
-            print(f"Respuesta:\n{respuesta}\n")
+            print("Respuesta:")
+            impresor = ImpresorSinMarkdown()
+            generar_respuesta_natural(pregunta, resultado, modelo, al_recibir=impresor)
+            impresor.terminar()
+            print()
 
 if __name__ == "__main__":
     try: